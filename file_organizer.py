@@ -7,20 +7,41 @@ Copyright (c) 2023 Mahmoud Ashraf (SNO7E)
 """
 import os
 import shutil
+import errno
 import json
 import argparse
 from pathlib import Path
 import logging
 import re
 import hashlib
+import mmap
 import datetime
 import collections
-import subprocess
+import concurrent.futures
+import sqlite3
+import threading
 from typing import Dict, List, Optional, Set, Tuple, Counter, Any
 import time
 import fnmatch
 import sys
 
+# Optional fast non-cryptographic hashers for duplicate detection
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+# Optional fast JSON encoder for reports and saved configs
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Set up logging
 logging.basicConfig(
     level=logging.INFO,
@@ -33,6 +54,28 @@ __version__ = "1.0.0"
 __author__ = "Mahmoud Ashraf (SNO7E)"
 __license__ = "MIT"
 
+# Files at least this large are hashed through a memory map
+MMAP_HASH_THRESHOLD = 10 * 1024 * 1024
+
+# Number of leading bytes hashed to split same-size duplicate candidates
+HEAD_HASH_SIZE = 4096
+
+# Number of threads used to hash files; hashing releases the GIL and is mostly I/O-bound
+HASH_WORKERS = min(32, (os.cpu_count() or 4) * 4)
+
+# Number of threads used to move files
+MOVE_WORKERS = 16
+
+# Name of the algorithm used for duplicate detection hashes
+HASH_ALGORITHM = "xxh3_64" if xxhash is not None else "blake3" if blake3 is not None else "sha1"
+
+# Persistent cache of file hashes, reused while a file's size and mtime are unchanged
+DEFAULT_HASH_CACHE = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "code-file-organizer",
+    "hashes.db"
+)
+
 # File type to folder mappings
 DEFAULT_MAPPINGS = {
     # Web Development
@@ -99,6 +142,144 @@ DEFAULT_MAPPINGS = {
     "sql": "Database/SQL",
 }
 
+def dumps_json(obj: Any) -> bytes:
+    """Serialize an object to indented JSON, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, indent=2).encode('utf-8')
+
+
+# Filename patterns that identify configuration files
+CONFIG_FILE_RE = re.compile(
+    r'(?:\.config(?:\.\w+)?|\.conf|\.ini|\.env(?:\.\w+)?|config\.\w+|\.ya?ml|\.toml|settings\.\w+)$',
+    re.IGNORECASE
+)
+
+# Configuration file types by suffix, the group name is the type
+CONFIG_TYPE_RE = re.compile(r'\.(?:(?P<YAML>ya?ml)|(?P<TOML>toml)|(?P<JSON>json)|(?P<INI>ini))$', re.IGNORECASE)
+ENV_FILE_RE = re.compile(r'\.env', re.IGNORECASE)
+
+# Script extensions whose shebang line is checked
+SCRIPT_EXTENSIONS = frozenset(['py', 'js', 'sh', 'bash', 'pl', 'rb'])
+
+# Number of leading bytes inspected when detecting a file's type from its content
+CONTENT_SNIFF_SIZE = 4096
+
+# Content patterns checked in order against the start of a file. Each pattern
+# is only run when one of its literal needles occurs in the content, which
+# is a much cheaper C-level substring search than the regex itself.
+CONTENT_PATTERNS = [
+    ("Web/HTML", (b'<',), re.compile(rb'<!DOCTYPE\s+html>|<html\b', re.IGNORECASE)),
+    ("Web/CSS", (b'@', b'body'), re.compile(rb'@import\s+url|@media\b|\bbody\s*{')),
+    ("Web/JavaScript", (b'import', b'export', b'function'),
+     re.compile(rb'import\s+.*\bfrom\b|\bexport\b.*\bclass\b|\bfunction\b')),
+    ("Database/SQL", (), re.compile(rb'SELECT\s+.*\bFROM\b|CREATE\s+TABLE|INSERT\s+INTO', re.IGNORECASE)),
+]
+
+
+class FileInfo:
+    """
+    Name, directory and extension of a file, parsed once from its path and
+    shared by the categorization steps.
+    """
+    __slots__ = ("path", "name", "dirpath", "ext", "size")
+    
+    def __init__(self, path: str, name: Optional[str] = None, size: Optional[int] = None):
+        self.path = path
+        self.name = name if name is not None else os.path.basename(path)
+        self.dirpath = os.path.dirname(path)
+        # Lowercase extension without the dot. Like os.path.splitext, dots that only
+        # lead the name (".bashrc") don't start an extension.
+        name = self.name
+        dot = name.rfind('.')
+        if dot > 0 and (name[0] != '.' or name[:dot].lstrip('.')):
+            self.ext = name[dot + 1:].lower()
+        else:
+            self.ext = ""
+        self.size = size
+
+
+class HashCache:
+    """
+    SQLite-backed cache of file hashes keyed by path.
+    A cached hash is only returned while the file's size and mtime match.
+    """
+    
+    def __init__(self, db_path: str = DEFAULT_HASH_CACHE, batch_size: int = 1000):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self._pending = []
+        # The cache is shared between the organize loop and background duplicate detection
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS file_hashes ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, algorithm TEXT, hash TEXT)"
+        )
+    
+    def get(self, file_path: str, st: os.stat_result) -> Optional[str]:
+        """Return the cached hash for a file, or None if missing or stale."""
+        with self._lock:
+            # Make queued hashes visible to the query
+            self._write_pending()
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, algorithm, hash FROM file_hashes WHERE path = ?",
+                (file_path,)
+            ).fetchone()
+            if row and row[0] == st.st_size and row[1] == st.st_mtime_ns and row[2] == HASH_ALGORITHM:
+                return row[3]
+            return None
+    
+    def put(self, file_path: str, st: os.stat_result, file_hash: str) -> None:
+        """Queue a hash to be stored, writing to the database in batches."""
+        with self._lock:
+            self._pending.append((file_path, st.st_size, st.st_mtime_ns, HASH_ALGORITHM, file_hash))
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+    
+    def rename(self, old_path: str, new_path: str) -> None:
+        """Carry a cached hash over to a file's new location after it is moved."""
+        with self._lock:
+            self._write_pending()
+            self._conn.execute("DELETE FROM file_hashes WHERE path = ?", (new_path,))
+            self._conn.execute("UPDATE file_hashes SET path = ? WHERE path = ?", (new_path, old_path))
+    
+    def flush(self) -> None:
+        """Write queued hashes and commit."""
+        with self._lock:
+            self._write_pending()
+            self._conn.commit()
+    
+    def _write_pending(self) -> None:
+        """Write queued hashes without committing."""
+        if self._pending:
+            self._conn.executemany("INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?, ?)", self._pending)
+            self._pending = []
+    
+    def prune(self, directory: str) -> None:
+        """Delete cached entries under a directory whose files no longer exist."""
+        with self._lock:
+            self.flush()
+            prefix = os.path.join(directory, "")
+            rows = self._conn.execute(
+                "SELECT path FROM file_hashes WHERE substr(path, 1, ?) = ?",
+                (len(prefix), prefix)
+            ).fetchall()
+            stale = [row for row in rows if not os.path.exists(row[0])]
+            if stale:
+                self._conn.executemany("DELETE FROM file_hashes WHERE path = ?", stale)
+            self._conn.commit()
+    
+    def close(self) -> None:
+        """Flush pending writes and close the database."""
+        with self._lock:
+            try:
+                self.flush()
+            finally:
+                self._conn.close()
+
+
 class FileOrganizer:
     def __init__(
         self, 
@@ -108,7 +289,8 @@ class FileOrganizer:
         project_mode: bool = False,
         exclude_dirs: Optional[List[str]] = None,
         exclude_files: Optional[List[str]] = None,
-        dry_run: bool = False
+        dry_run: bool = False,
+        hash_cache: Optional[str] = DEFAULT_HASH_CACHE
     ):
         self.source_dir = os.path.abspath(source_dir)
         self.target_dir = os.path.abspath(target_dir) if target_dir else self.source_dir
@@ -117,6 +299,20 @@ class FileOrganizer:
         self.exclude_dirs = exclude_dirs or ['.git', '.vscode', 'node_modules', 'venv', 'env', '__pycache__']
         self.exclude_files = exclude_files or ['file_organizer.py', 'file_organizer_config.json']
         self.dry_run = dry_run
+        self.hash_cache = hash_cache
+        self._exclude_dirs = frozenset(self.exclude_dirs)
+        self._exclude_files = frozenset(self.exclude_files)
+        self._target_dev = None
+        self._made_dirs = set()
+        
+        # Target folders don't change during a run, so resolve them up front
+        self._ext_to_subdir = {
+            ext: os.path.join(self.target_dir, folder) for ext, folder in self.mappings.items()
+        }
+        self._target_bases = {}
+        self._hash_cache = None
+        # Set to stop background duplicate detection when the organize run is interrupted
+        self._stop_hashing = threading.Event()
         
         # Stats
         self.stats = {
@@ -128,43 +324,72 @@ class FileOrganizer:
     
     def should_exclude(self, path: str) -> bool:
         """Check if a file or directory should be excluded from organization."""
-        file_name = os.path.basename(path)
-        
         # Check if it's in the exclude list
-        if file_name in self.exclude_files:
+        if os.path.basename(path) in self._exclude_files:
             return True
             
         # Check if it's a parent directory in exclude list
-        for excluded_dir in self.exclude_dirs:
-            if excluded_dir in path.split(os.sep):
-                return True
-                
-        return False
+        return not self._exclude_dirs.isdisjoint(path.split(os.sep))
     
     def get_target_path(self, file_path: str) -> Optional[str]:
         """Determine the target path for a file based on its extension."""
-        # Get the file extension (without the dot)
-        _, ext = os.path.splitext(file_path)
-        ext = ext[1:].lower() if ext else ""
-        
+        return self._get_target_path(FileInfo(file_path))
+    
+    def _get_target_path(self, info: FileInfo) -> Optional[str]:
+        """Determine the target path for an already-parsed file based on its extension."""
+        ext = info.ext
         if not ext:
             return None
             
-        if ext in self.mappings:
+        target_subdir = self._ext_to_subdir.get(ext)
+        if target_subdir is not None:
             # If using project mode, keep the relative path structure
             if self.project_mode:
-                rel_path = os.path.relpath(os.path.dirname(file_path), self.source_dir)
-                if rel_path == ".":
-                    rel_path = ""
-                target_subdir = os.path.join(self.target_dir, rel_path, self.mappings[ext])
-            else:
-                target_subdir = os.path.join(self.target_dir, self.mappings[ext])
+                target_subdir = os.path.join(self._get_target_base(info.dirpath), self.mappings[ext])
                 
-            return os.path.join(target_subdir, os.path.basename(file_path))
+            return os.path.join(target_subdir, info.name)
         
         self.stats["unknown_extensions"].add(ext)
         return None
     
+    def _get_target_base(self, dirpath: str) -> str:
+        """Return the target directory mirroring a source directory in project mode, cached per directory."""
+        target_base = self._target_bases.get(dirpath)
+        if target_base is None:
+            rel_path = os.path.relpath(dirpath, self.source_dir)
+            if rel_path == ".":
+                rel_path = ""
+            target_base = os.path.join(self.target_dir, rel_path)
+            self._target_bases[dirpath] = target_base
+        return target_base
+    
+    def _iter_files(self, directory: str):
+        """
+        Recursively yield (DirEntry, path) pairs for files under a directory.
+        Excluded and symlinked directories are not descended into. The DirEntry
+        caches its stat result, so callers can reuse it instead of re-stating.
+        """
+        try:
+            with os.scandir(directory) as it:
+                entries = list(it)
+        except OSError as e:
+            logger.error(f"Error reading directory {directory}: {e}")
+            return
+        
+        subdirs = []
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if not is_dir:
+                yield entry, entry.path
+            elif not entry.is_symlink() and entry.name not in self._exclude_dirs:
+                subdirs.append(entry.path)
+        
+        for subdir in subdirs:
+            yield from self._iter_files(subdir)
+    
     def organize_files(self):
         """Walk through the directory and organize files."""
         logger.info(f"Starting file organization from {self.source_dir} to {self.target_dir}")
@@ -173,89 +398,384 @@ class FileOrganizer:
         # Detect project structure before organizing
         self.detect_project_structure()
         
-        # Detect duplicate files
-        self.duplicate_files = self.find_duplicate_files() if not self.dry_run else {}
-        
         start_time = time.time()
-        for root, dirs, files in os.walk(self.source_dir, topdown=True):
-            # Skip excluded directories
-            dirs[:] = [d for d in dirs if not self.should_exclude(os.path.join(root, d))]
+        
+        # Plan every move in a single pass, collecting file stats for duplicate detection
+        file_stats = {}
+        moves = []
+        for entry, file_path in self._iter_files(self.source_dir):
+            self.stats["total_files"] += 1
             
-            for file in files:
-                self.stats["total_files"] += 1
-                file_path = os.path.join(root, file)
-                
-                # Skip excluded files
-                if self.should_exclude(file_path):
-                    logger.debug(f"Skipping excluded file: {file_path}")
-                    self.stats["skipped_files"] += 1
-                    continue
-                
-                # Check if file is a duplicate
-                file_hash = self.get_file_hash(file_path) if not self.dry_run else None
-                if file_hash and file_hash in self.duplicate_files and len(self.duplicate_files[file_hash]) > 1:
-                    self.stats.setdefault("duplicate_files", 0)
-                    self.stats["duplicate_files"] += 1
-                    
-                # Try smart categorization first
-                target_path = self.smart_categorize_file(file_path)
-                
-                # Fall back to extension-based categorization
-                if not target_path:
-                    target_path = self.get_target_path(file_path)
-                
-                if not target_path:
-                    logger.debug(f"No mapping found for file: {file_path}")
-                    self.stats["skipped_files"] += 1
-                    continue
-                
-                # Skip if source and destination are the same
-                if os.path.normpath(file_path) == os.path.normpath(target_path):
-                    logger.debug(f"Source and destination are the same: {file_path}")
-                    self.stats["skipped_files"] += 1
-                    continue
-                
-                # Create target directory if it doesn't exist
-                os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            # Skip excluded files
+            if self.should_exclude(file_path):
+                logger.debug(f"Skipping excluded file: {file_path}")
+                self.stats["skipped_files"] += 1
+                continue
+            
+            try:
+                file_stats[file_path] = entry.stat()
+            except OSError as e:
+                logger.error(f"Error reading {file_path}: {e}")
+                self.stats["skipped_files"] += 1
+                continue
+            
+            info = FileInfo(file_path, entry.name, file_stats[file_path].st_size)
+            
+            # Try smart categorization first
+            target_path = self._smart_categorize(info)
+            
+            # Fall back to extension-based categorization
+            if not target_path:
+                target_path = self._get_target_path(info)
+            
+            if not target_path:
+                logger.debug(f"No mapping found for file: {file_path}")
+                self.stats["skipped_files"] += 1
+                continue
+            
+            # Skip if source and destination are the same
+            if os.path.normpath(file_path) == os.path.normpath(target_path):
+                logger.debug(f"Source and destination are the same: {file_path}")
+                self.stats["skipped_files"] += 1
+                continue
+            
+            moves.append((file_path, target_path))
+        
+        try:
+            self._target_dev = os.stat(self.target_dir).st_dev
+        except OSError:
+            self._target_dev = None
+        
+        # Create all target directories before moving anything
+        for _, target_path in moves:
+            target_subdir = os.path.dirname(target_path)
+            if target_subdir not in self._made_dirs:
+                os.makedirs(target_subdir, exist_ok=True)
+                self._made_dirs.add(target_subdir)
+        
+        try:
+            if not self.dry_run:
+                # Only files sharing a size with another file can be duplicates. Their moves wait
+                # for duplicate detection, which runs in the background while the others are moved.
+                ambiguous_sizes = self._get_ambiguous_sizes(file_stats)
+                deferred_targets = {
+                    target_path for file_path, target_path in moves
+                    if file_stats[file_path].st_size in ambiguous_sizes
+                }
                 
-                # Move the file
-                if not self.dry_run:
+                self.get_hash_cache()
+                self._stop_hashing.clear()
+                with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+                    duplicates_future = executor.submit(self._find_duplicates, file_stats, ambiguous_sizes)
+                    try:
+                        self._move_files([move for move in moves if move[1] not in deferred_targets], file_stats)
+                    except BaseException:
+                        # Don't wait for duplicate detection to hash every file on an error or Ctrl-C
+                        duplicates_future.cancel()
+                        self._stop_hashing.set()
+                        raise
                     try:
-                        shutil.move(file_path, target_path)
-                        logger.info(f"Moved: {file_path} -> {target_path}")
-                        self.stats["organized_files"] += 1
+                        self.duplicate_files = duplicates_future.result()
                     except Exception as e:
-                        logger.error(f"Error moving {file_path}: {e}")
-                        self.stats["skipped_files"] += 1
-                else:
+                        # The other files are already moved, so finish the run without duplicate info
+                        logger.error(f"Error finding duplicate files: {e}")
+                        self.duplicate_files = {}
+                self._move_files([move for move in moves if move[1] in deferred_targets], file_stats)
+                
+                duplicate_count = sum(len(paths) for paths in self.duplicate_files.values())
+                if duplicate_count:
+                    self.stats["duplicate_files"] = duplicate_count
+            else:
+                self.duplicate_files = {}
+                for file_path, target_path in moves:
                     logger.info(f"Would move: {file_path} -> {target_path}")
                     self.stats["organized_files"] += 1
+        finally:
+            self.close_hash_cache()
         
         # Calculate execution time
         self.stats["execution_time"] = time.time() - start_time
     
-    def get_file_hash(self, file_path: str, block_size: int = 65536) -> str:
+    def _move_files(self, moves: List[Tuple[str, str]], file_stats: Dict[str, os.stat_result]) -> None:
+        """
+        Perform planned moves concurrently.
+        Moves that share a target path are kept in order on a single thread.
+        """
+        moves_by_target = collections.OrderedDict()
+        for file_path, target_path in moves:
+            moves_by_target.setdefault(target_path, []).append(file_path)
+        
+        with concurrent.futures.ThreadPoolExecutor(max_workers=MOVE_WORKERS) as executor:
+            futures = [
+                executor.submit(self._move_group, file_paths, target_path, file_stats)
+                for target_path, file_paths in moves_by_target.items()
+            ]
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    for file_path, target_path, error in future.result():
+                        if error is None:
+                            # Read the cache once, background duplicate detection may disable it
+                            cache = self._hash_cache
+                            if cache is not None:
+                                try:
+                                    cache.rename(file_path, target_path)
+                                except sqlite3.Error as e:
+                                    self._disable_hash_cache(e)
+                            logger.info(f"Moved: {file_path} -> {target_path}")
+                            self.stats["organized_files"] += 1
+                        else:
+                            logger.error(f"Error moving {file_path}: {error}")
+                            self.stats["skipped_files"] += 1
+            except BaseException:
+                # Don't start the queued moves on an error or Ctrl-C, only wait for the running ones
+                for future in futures:
+                    future.cancel()
+                raise
+    
+    def _move_group(
+        self,
+        file_paths: List[str],
+        target_path: str,
+        file_stats: Dict[str, os.stat_result]
+    ) -> List[Tuple[str, str, Optional[Exception]]]:
+        """Move files to the same target path in order, returning each move with its error if it failed."""
+        results = []
+        for file_path in file_paths:
+            try:
+                self._move_file(file_path, target_path, file_stats[file_path].st_dev)
+                results.append((file_path, target_path, None))
+            except Exception as e:
+                results.append((file_path, target_path, e))
+        return results
+    
+    def _move_file(self, file_path: str, target_path: str, source_dev: int) -> None:
+        """
+        Move a file, renaming it directly when it is on the same filesystem as the target.
+        Falls back to shutil.move, which copies the data, across filesystems.
+        """
+        if source_dev == self._target_dev:
+            try:
+                os.replace(file_path, target_path)
+                return
+            except OSError as e:
+                # The target may be on another mount below the target directory
+                if e.errno != errno.EXDEV:
+                    raise
+        shutil.move(file_path, target_path)
+    
+    @staticmethod
+    def _new_hasher():
+        """
+        Create a hasher for duplicate detection.
+        The digest is only compared for equality, so the fastest available
+        algorithm is used: xxHash, then BLAKE3, then SHA-1 from hashlib.
+        """
+        if xxhash is not None:
+            return xxhash.xxh3_64()
+        if blake3 is not None:
+            return blake3.blake3(max_threads=blake3.blake3.AUTO)
+        return hashlib.sha1()
+    
+    def get_file_hash(self, file_path: str, block_size: int = 1024 * 1024) -> str:
         """Generate a hash for a file to identify duplicates."""
-        hasher = hashlib.md5()
+        hasher = self._new_hasher()
+        with open(file_path, 'rb') as f:
+            file_size = os.fstat(f.fileno()).st_size
+            if file_size >= MMAP_HASH_THRESHOLD:
+                # Let the hasher read the page cache directly, without copying into Python buffers
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    if hasattr(mm, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+                        mm.madvise(mmap.MADV_SEQUENTIAL)
+                    hasher.update(mm)
+            else:
+                for block in iter(lambda: f.read(block_size), b''):
+                    hasher.update(block)
+        return hasher.hexdigest()
+    
+    def get_hash_cache(self) -> Optional[HashCache]:
+        """Open the persistent hash cache on first use, or return None if it is disabled or unavailable."""
+        # Read the attributes once, another thread may disable the cache meanwhile
+        cache = self._hash_cache
+        db_path = self.hash_cache
+        if cache is None and db_path:
+            try:
+                cache = self._hash_cache = HashCache(db_path)
+            except (sqlite3.Error, OSError) as e:
+                logger.warning(f"Hash cache disabled, could not open {db_path}: {e}")
+                self.hash_cache = None
+        return cache
+    
+    def get_cached_file_hash(self, file_path: str, st: Optional[os.stat_result] = None) -> str:
+        """Return a file's hash from the persistent cache, hashing and caching it on a miss."""
+        cache = self.get_hash_cache()
+        if cache is None:
+            return self.get_file_hash(file_path)
+        
+        if st is None:
+            st = os.stat(file_path)
+        try:
+            file_hash = cache.get(file_path, st)
+        except sqlite3.Error as e:
+            self._disable_hash_cache(e)
+            return self.get_file_hash(file_path)
+        if file_hash is None:
+            file_hash = self.get_file_hash(file_path)
+            try:
+                cache.put(file_path, st, file_hash)
+            except sqlite3.Error as e:
+                self._disable_hash_cache(e)
+        return file_hash
+    
+    def _disable_hash_cache(self, error: Exception) -> None:
+        """
+        Stop using the hash cache for the rest of the run after a database error,
+        e.g. when another run holds a lock on it. The cache is only an optimization,
+        so files are hashed directly instead.
+        """
+        cache = self._hash_cache
+        if cache is None:
+            return
+        # Clear the path first so get_hash_cache doesn't reopen it
+        self.hash_cache = None
+        self._hash_cache = None
+        logger.warning(f"Hash cache disabled after a database error: {error}")
+        try:
+            cache.close()
+        except sqlite3.Error:
+            pass
+    
+    def close_hash_cache(self) -> None:
+        """Drop stale cache entries for the source directory and close the cache."""
+        cache = self._hash_cache
+        if cache is not None:
+            self._hash_cache = None
+            try:
+                cache.prune(self.source_dir)
+                cache.close()
+            except sqlite3.Error as e:
+                logger.warning(f"Could not update hash cache: {e}")
+    
+    def get_file_head_hash(self, file_path: str, head_size: int = HEAD_HASH_SIZE) -> str:
+        """Generate a cheap hash of the first bytes of a file to pre-filter duplicate candidates."""
+        hasher = self._new_hasher()
         with open(file_path, 'rb') as f:
-            for block in iter(lambda: f.read(block_size), b''):
-                hasher.update(block)
+            hasher.update(f.read(head_size))
         return hasher.hexdigest()
     
+    def _hash_files(self, file_paths: List[str], hash_func) -> Dict[str, str]:
+        """Hash files concurrently, returning a mapping of path to hash for the files that could be read."""
+        hashes = {}
+        if not file_paths:
+            return hashes
+        
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(HASH_WORKERS, len(file_paths))) as executor:
+            futures = {executor.submit(hash_func, file_path): file_path for file_path in file_paths}
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    if self._stop_hashing.is_set():
+                        raise concurrent.futures.CancelledError()
+                    file_path = futures[future]
+                    try:
+                        hashes[file_path] = future.result()
+                    except (IOError, OSError) as e:
+                        logger.error(f"Error hashing file {file_path}: {e}")
+            except BaseException:
+                # Don't hash the queued files on an error or Ctrl-C, only wait for the running ones
+                for future in futures:
+                    future.cancel()
+                raise
+        return hashes
+    
     def find_duplicate_files(self) -> Dict[str, List[str]]:
         """Find duplicate files in the source directory."""
+        file_stats = {}
+        for entry, file_path in self._iter_files(self.source_dir):
+            if not self.should_exclude(file_path):
+                try:
+                    file_stats[file_path] = entry.stat()
+                except OSError as e:
+                    logger.error(f"Error reading size of {file_path}: {e}")
+        
+        return self._find_duplicates(file_stats)
+    
+    @staticmethod
+    def _get_ambiguous_sizes(file_stats: Dict[str, os.stat_result]) -> Set[int]:
+        """Return the sizes shared by more than one file. Files with a unique size cannot have duplicates."""
+        size_counts = collections.Counter(st.st_size for st in file_stats.values())
+        return {file_size for file_size, count in size_counts.items() if count > 1}
+    
+    def _find_duplicates(
+        self,
+        file_stats: Dict[str, os.stat_result],
+        ambiguous_sizes: Optional[Set[int]] = None
+    ) -> Dict[str, List[str]]:
+        """
+        Find duplicates among already-stat'ed files.
+        Files are grouped by size, then by a hash of their first 4KB, and only
+        files that still share a group are fully hashed.
+        The sizes shared by several files can be passed in when already known.
+        """
         logger.info("Scanning for duplicate files...")
+        if ambiguous_sizes is None:
+            ambiguous_sizes = self._get_ambiguous_sizes(file_stats)
+        size_map = collections.defaultdict(list)
+        for file_path, st in file_stats.items():
+            if st.st_size in ambiguous_sizes:
+                size_map[st.st_size].append(file_path)
+        
+        # Empty files are all identical, so there is nothing to read
+        candidates = [
+            path for file_size in ambiguous_sizes if file_size for path in size_map[file_size]
+        ]
+        head_hashes = self._hash_files(candidates, self.get_file_head_hash)
+        if 0 in ambiguous_sizes:
+            empty_hash = self._new_hasher().hexdigest()
+            head_hashes.update((file_path, empty_hash) for file_path in size_map[0])
+        
+        head_map = collections.defaultdict(list)
+        for file_size in ambiguous_sizes:
+            for file_path in size_map[file_size]:
+                if file_path in head_hashes:
+                    head_map[(file_size, head_hashes[file_path])].append(file_path)
+        
         duplicate_map = collections.defaultdict(list)
+        full_candidates = []
+        for (file_size, head_hash), paths in head_map.items():
+            if len(paths) < 2:
+                continue
+            # The head hash already covers the whole content of small files
+            if file_size <= HEAD_HASH_SIZE:
+                duplicate_map[head_hash].extend(paths)
+            else:
+                full_candidates.extend(paths)
         
-        for root, _, files in os.walk(self.source_dir):
-            for filename in files:
-                file_path = os.path.join(root, filename)
-                if not self.should_exclude(file_path):
-                    try:
-                        file_hash = self.get_file_hash(file_path)
-                        duplicate_map[file_hash].append(file_path)
-                    except (IOError, OSError) as e:
-                        logger.error(f"Error hashing file {file_path}: {e}")
+        # Reuse cached hashes and only hash the files that changed since the last run
+        cache = self.get_hash_cache()
+        file_hashes = {}
+        if cache is not None:
+            try:
+                for file_path in full_candidates:
+                    cached = cache.get(file_path, file_stats[file_path])
+                    if cached is not None:
+                        file_hashes[file_path] = cached
+            except sqlite3.Error as e:
+                self._disable_hash_cache(e)
+                cache = None
+        
+        to_hash = [file_path for file_path in full_candidates if file_path not in file_hashes]
+        new_hashes = self._hash_files(to_hash, self.get_file_hash)
+        if cache is not None:
+            try:
+                for file_path, file_hash in new_hashes.items():
+                    cache.put(file_path, file_stats[file_path], file_hash)
+                cache.flush()
+            except sqlite3.Error as e:
+                self._disable_hash_cache(e)
+        file_hashes.update(new_hashes)
+        
+        for file_path in full_candidates:
+            if file_path in file_hashes:
+                duplicate_map[file_hashes[file_path]].append(file_path)
         
         # Filter out files that don't have duplicates
         return {k: v for k, v in duplicate_map.items() if len(v) > 1}
@@ -294,12 +814,17 @@ class FileOrganizer:
         
         # Other projects can be detected similarly
     
-    def smart_categorize_file(self, file_path: str) -> Optional[str]:
+    def smart_categorize_file(self, file_path: str, file_size: Optional[int] = None) -> Optional[str]:
         """
         Intelligently categorize a file based on its content and naming patterns.
         Returns the target path or None if no smart categorization is possible.
+        The file size can be passed in when already known to avoid another stat.
         """
-        filename = os.path.basename(file_path)
+        return self._smart_categorize(FileInfo(file_path, size=file_size))
+    
+    def _smart_categorize(self, info: FileInfo) -> Optional[str]:
+        """Smart categorization of an already-parsed file, see smart_categorize_file."""
+        filename = info.name
         
         # Check for config files first
         if self.is_config_file(filename):
@@ -307,108 +832,89 @@ class FileOrganizer:
             return os.path.join(target_subdir, filename)
         
         # Try to analyze content for files that aren't too large
-        file_size = os.path.getsize(file_path)
-        if file_size < 500 * 1024:  # Skip files larger than 500KB
+        file_size = info.size
+        if file_size is None:
             try:
-                file_type = self.detect_file_type_from_content(file_path)
-                if file_type:
-                    if self.project_mode:
-                        rel_path = os.path.relpath(os.path.dirname(file_path), self.source_dir)
-                        if rel_path == ".":
-                            rel_path = ""
-                        target_subdir = os.path.join(self.target_dir, rel_path, file_type)
-                    else:
-                        target_subdir = os.path.join(self.target_dir, file_type)
-                        
-                    return os.path.join(target_subdir, filename)
-            except (IOError, UnicodeDecodeError) as e:
-                logger.debug(f"Could not analyze content of {file_path}: {e}")
+                file_size = os.path.getsize(info.path)
+            except OSError as e:
+                logger.debug(f"Could not analyze content of {info.path}: {e}")
+                return None
+        if file_size < 500 * 1024:  # Skip files larger than 500KB
+            file_type = self._detect_file_type_from_content(info)
+            if file_type:
+                if self.project_mode:
+                    target_subdir = os.path.join(self._get_target_base(info.dirpath), file_type)
+                else:
+                    target_subdir = os.path.join(self.target_dir, file_type)
+                    
+                return os.path.join(target_subdir, filename)
         
         return None
     
     def is_config_file(self, filename: str) -> bool:
         """Detect if a file is a configuration file based on its name."""
-        config_patterns = [
-            r'\.config(\.\w+)?$',
-            r'\.conf$',
-            r'\.ini$',
-            r'\.env(\.\w+)?$',
-            r'config\.\w+$',
-            r'\.ya?ml$',
-            r'\.toml$',
-            r'settings\.\w+$',
-        ]
-        
-        return any(re.search(pattern, filename, re.IGNORECASE) for pattern in config_patterns)
+        return CONFIG_FILE_RE.search(filename) is not None
     
     def get_config_type(self, filename: str) -> str:
         """Determine the type of configuration file."""
-        if re.search(r'\.ya?ml$', filename, re.IGNORECASE):
-            return "YAML"
-        elif re.search(r'\.toml$', filename, re.IGNORECASE):
-            return "TOML"
-        elif re.search(r'\.json$', filename, re.IGNORECASE):
-            return "JSON"
-        elif re.search(r'\.env', filename, re.IGNORECASE):
+        match = CONFIG_TYPE_RE.search(filename)
+        # An .env marker takes precedence over the .ini suffix only
+        if match and match.lastgroup != "INI":
+            return match.lastgroup
+        if ENV_FILE_RE.search(filename):
             return "Environment"
-        elif re.search(r'\.ini$', filename, re.IGNORECASE):
-            return "INI"
-        else:
-            return "General"
+        return match.lastgroup if match else "General"
     
     def detect_file_type_from_content(self, file_path: str) -> Optional[str]:
         """Analyze file content to determine its type."""
-        _, ext = os.path.splitext(file_path)
-        ext = ext.lower()
+        return self._detect_file_type_from_content(FileInfo(file_path))
+    
+    def _detect_file_type_from_content(self, info: FileInfo) -> Optional[str]:
+        """Content analysis of an already-parsed file, see detect_file_type_from_content."""
+        # Read the start of the file once, for both the shebang and the content patterns
+        try:
+            with open(info.path, 'rb') as f:
+                file_size = info.size if info.size is not None else os.fstat(f.fileno()).st_size
+                if not file_size:
+                    return None
+                with mmap.mmap(f.fileno(), min(file_size, CONTENT_SNIFF_SIZE), access=mmap.ACCESS_READ) as mm:
+                    content = mm[:]
+        except (IOError, ValueError):
+            return None  # Couldn't read
         
         # Special handling for scripts
-        if ext in ['.py', '.js', '.sh', '.bash', '.pl', '.rb']:
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    first_line = f.readline().strip()
-                    
-                    # Look for shebang
-                    if first_line.startswith('#!'):
-                        if 'python' in first_line:
-                            return "Python/Scripts"
-                        elif 'node' in first_line:
-                            return "Web/JavaScript/Scripts"
-                        elif any(shell in first_line for shell in ['bash', 'sh', 'zsh']):
-                            return "Scripts/Shell"
-                        elif 'ruby' in first_line:
-                            return "Ruby/Scripts"
-                        elif 'perl' in first_line:
-                            return "Perl/Scripts"
-            except UnicodeDecodeError:
-                pass  # Not a text file
-        
-        # Try to identify based on common content patterns
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read(4096)  # Read the first 4KB
-                
-                # HTML detection
-                if re.search(r'<!DOCTYPE\s+html>|<html\b', content, re.IGNORECASE):
-                    return "Web/HTML"
-                
-                # CSS detection
-                if re.search(r'@import\s+url|@media\b|\bbody\s*{', content):
-                    return "Web/CSS"
-                
-                # JavaScript/TypeScript detection
-                if re.search(r'import\s+.*\bfrom\b|\bexport\b.*\bclass\b|\bfunction\b', content):
-                    if 'React' in content or 'jsx' in content:
-                        return "Web/React"
-                    if 'interface ' in content or ': string' in content:
-                        return "Web/TypeScript"
-                    return "Web/JavaScript"
-                
-                # SQL detection
-                if re.search(r'SELECT\s+.*\bFROM\b|CREATE\s+TABLE|INSERT\s+INTO', content, re.IGNORECASE):
-                    return "Database/SQL"
+        if info.ext in SCRIPT_EXTENSIONS:
+            first_line = content.split(b'\n', 1)[0].strip()
+            
+            # Look for shebang
+            if first_line.startswith(b'#!'):
+                if b'python' in first_line:
+                    return "Python/Scripts"
+                elif b'node' in first_line:
+                    return "Web/JavaScript/Scripts"
+                elif any(shell in first_line for shell in [b'bash', b'sh', b'zsh']):
+                    return "Scripts/Shell"
+                elif b'ruby' in first_line:
+                    return "Ruby/Scripts"
+                elif b'perl' in first_line:
+                    return "Perl/Scripts"
+        
+        # Treat files with NUL bytes as binary
+        if b'\0' in content:
+            return None
         
-        except (UnicodeDecodeError, IOError):
-            pass  # Not a text file or couldn't read
+        for file_type, needles, pattern in CONTENT_PATTERNS:
+            if needles and not any(needle in content for needle in needles):
+                continue
+            if not pattern.search(content):
+                continue
+            # Narrow down JavaScript to React or TypeScript
+            if file_type == "Web/JavaScript":
+                if b'React' in content or b'jsx' in content:
+                    return "Web/React"
+                if b'interface ' in content or b': string' in content:
+                    return "Web/TypeScript"
+            return file_type
             
         return None
     
@@ -446,13 +952,13 @@ class FileOrganizer:
             "source_directory": self.source_dir,
             "target_directory": self.target_dir,
             "project_mode": self.project_mode,
-            "statistics": self.stats,
+            "statistics": dict(self.stats, unknown_extensions=sorted(self.stats["unknown_extensions"])),
             "version": __version__
         }
         
         report_path = os.path.join(self.target_dir, report_file)
-        with open(report_path, 'w') as f:
-            json.dump(report, f, indent=2)
+        with open(report_path, 'wb') as f:
+            f.write(dumps_json(report))
             
         logger.info(f"Report generated at: {report_path}")
     
@@ -467,8 +973,8 @@ class FileOrganizer:
             "exclude_files": self.exclude_files
         }
         
-        with open(config_file, 'w') as f:
-            json.dump(config, f, indent=4)
+        with open(config_file, 'wb') as f:
+            f.write(dumps_json(config))
         
         logger.info(f"Configuration saved to {config_file}")
     
@@ -490,19 +996,13 @@ class FileOrganizer:
     
     @staticmethod
     def check_git_repo(directory: str) -> bool:
-        """Check if the directory is a git repository."""
-        try:
-            result = subprocess.run(
-                ["git", "-C", directory, "rev-parse", "--is-inside-work-tree"],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                check=False
-            )
-            return result.returncode == 0
-        except FileNotFoundError:
-            # Git not installed
-            return False
+        """Check if the directory is inside a git repository by looking for a .git entry in it or its parents."""
+        path = Path(directory).resolve()
+        for parent in [path] + list(path.parents):
+            # .git is a directory in regular repositories and a file in worktrees and submodules
+            if (parent / '.git').exists():
+                return True
+        return False
     
     @staticmethod
     def get_project_version() -> str:
@@ -510,7 +1010,7 @@ class FileOrganizer:
         return __version__
 
 
-def main():
+def main(argv: Optional[List[str]] = None):
     parser = argparse.ArgumentParser(description="Organize code files into directories based on file type or project structure.")
     parser.add_argument("source_dir", nargs="?", default=os.getcwd(), help="Source directory to organize (default: current directory)")
     parser.add_argument("--target-dir", "-t", help="Target directory to move files to (default: same as source)")
@@ -523,12 +1023,13 @@ def main():
     parser.add_argument("--report-file", default="organization_report.json", help="Path to save the report file")
     parser.add_argument("--no-smart", action="store_true", help="Disable smart categorization and use only extensions")
     parser.add_argument("--no-duplicates", action="store_true", help="Disable duplicate file detection")
+    parser.add_argument("--no-hash-cache", action="store_true", help="Do not reuse or store file hashes between runs")
     parser.add_argument("--exclude-dir", action="append", help="Additional directories to exclude, can be specified multiple times")
     parser.add_argument("--exclude-file", action="append", help="Additional files to exclude, can be specified multiple times")
     parser.add_argument("--version", "-v", action="version", version=f"Code File Organizer v{__version__} by {__author__}")
     parser.add_argument("--verbose", action="store_true", help="Enable verbose logging")
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     # Configure logging level
     if args.verbose:
@@ -539,6 +1040,8 @@ def main():
         organizer = FileOrganizer.load_config(args.config_file)
         if not organizer:
             organizer = FileOrganizer(args.source_dir, args.target_dir, project_mode=args.project_mode, dry_run=args.dry_run)
+        if args.no_hash_cache:
+            organizer.hash_cache = None
     else:
         # Prepare exclude lists
         exclude_dirs = ['.git', '.vscode', 'node_modules', 'venv', 'env', '__pycache__']
@@ -555,7 +1058,8 @@ def main():
             project_mode=args.project_mode, 
             dry_run=args.dry_run,
             exclude_dirs=exclude_dirs,
-            exclude_files=exclude_files
+            exclude_files=exclude_files,
+            hash_cache=None if args.no_hash_cache else DEFAULT_HASH_CACHE
         )
     
     # Display banner
@@ -47,6 +47,10 @@ setup(
     ],
     python_requires=">=3.6",
     install_requires=[],  # No external dependencies
+    extras_require={
+        "fast": ["xxhash", "orjson"],  # Faster duplicate detection hashing and JSON output
+        "test": ["pytest", "pytest-xdist"],  # Running the test suite in parallel
+    },
     keywords="file organizer, code organization, directory structure",
     project_urls={
         "Bug Tracker": "https://github.com/SNO7E-G/code-file-organizer/issues",
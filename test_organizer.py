@@ -4,61 +4,34 @@ Test script for the Code File Organizer
 This script creates a temporary test directory with various file types,
 then runs the organizer on it and verifies the results.
 
+Each test works on its own copy of the test files and shares no state with
+the others, so the suite can run in parallel, e.g. `pytest -n auto test_organizer.py`
+with pytest-xdist.
+
 Copyright (c) 2023 Mahmoud Ashraf (SNO7E)
 """
 import os
 import shutil
+import sys
 import tempfile
+import threading
 import unittest
-import subprocess
-import sys
+from unittest import mock
 import json
 from pathlib import Path
 
-class TestFileOrganizer(unittest.TestCase):
-    def setUp(self):
-        # Create a temporary directory
-        self.test_dir = tempfile.mkdtemp()
-        self.original_dir = os.getcwd()
-        
-        # Create some test files with different extensions
-        self.create_test_files()
-        
-    def tearDown(self):
-        # Clean up the temporary directory
-        os.chdir(self.original_dir)
-        shutil.rmtree(self.test_dir)
-        
-    def create_test_files(self):
-        """Create test files with different extensions"""
-        # Create files at root level
-        open(os.path.join(self.test_dir, "script.py"), "w").write("print('Hello, World!')")
-        open(os.path.join(self.test_dir, "index.html"), "w").write("<html><body>Hello</body></html>")
-        open(os.path.join(self.test_dir, "styles.css"), "w").write("body { color: black; }")
-        open(os.path.join(self.test_dir, "data.json"), "w").write('{"key": "value"}')
-        open(os.path.join(self.test_dir, "readme.md"), "w").write("# Test Project")
-        
-        # Create a subdirectory with files
-        sub_dir = os.path.join(self.test_dir, "src")
-        os.makedirs(sub_dir, exist_ok=True)
-        open(os.path.join(sub_dir, "app.js"), "w").write("console.log('Hello');")
-        open(os.path.join(sub_dir, "utils.py"), "w").write("def hello(): return 'Hello'")
-        
-        # Create another subdirectory with more files
-        sub_dir2 = os.path.join(self.test_dir, "docs")
-        os.makedirs(sub_dir2, exist_ok=True)
-        open(os.path.join(sub_dir2, "guide.md"), "w").write("# User Guide")
-        open(os.path.join(sub_dir2, "config.json"), "w").write('{"debug": true}')
-        
-        # Create files for smart detection testing
-        self.create_smart_detection_test_files()
-    
-    def create_smart_detection_test_files(self):
-        """Create files that can be detected by content analysis"""
-        # React component with js extension
-        react_dir = os.path.join(self.test_dir, "components")
-        os.makedirs(react_dir, exist_ok=True)
-        react_content = """
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+import file_organizer
+
+# ignore_cleanup_errors is only available on Python 3.10+
+TEMPDIR_OPTIONS = {"ignore_cleanup_errors": True} if sys.version_info >= (3, 10) else {}
+
+# React component with js extension
+REACT_CONTENT = b"""
 import React from 'react';
 
 const Button = ({ onClick, text }) => {
@@ -71,26 +44,23 @@ const Button = ({ onClick, text }) => {
 
 export default Button;
 """
-        open(os.path.join(react_dir, "Button.js"), "w").write(react_content)
-        
-        # Config file
-        config_content = """
+
+# Config file
+CONFIG_CONTENT = b"""
 # App configuration
 DEBUG=true
 API_URL=https://api.example.com
 SECRET_KEY=abcdef123456
 """
-        open(os.path.join(self.test_dir, "app.config"), "w").write(config_content)
-        
-        # Script with shebang
-        script_content = """#!/usr/bin/env python3
+
+# Script with shebang
+SCRIPT_CONTENT = b"""#!/usr/bin/env python3
 import sys
 print(f"Arguments: {sys.argv}")
 """
-        open(os.path.join(self.test_dir, "run.sh"), "w").write(script_content)
-        
-        # SQL file
-        sql_content = """
+
+# SQL file
+SQL_CONTENT = b"""
 CREATE TABLE users (
     id INTEGER PRIMARY KEY,
     name TEXT NOT NULL,
@@ -99,89 +69,303 @@ CREATE TABLE users (
 
 INSERT INTO users (name, email) VALUES ('John Doe', 'john@example.com');
 """
-        open(os.path.join(self.test_dir, "database.txt"), "w").write(sql_content)
-        
+
+DUPLICATE_CONTENT = b"This is a duplicate file for testing purposes."
+
+class TestFileOrganizer(unittest.TestCase):
+    # Test files with different extensions, relative to the test directory
+    FILES = [
+        ("script.py", b"print('Hello, World!')"),
+        ("index.html", b"<html><body>Hello</body></html>"),
+        ("styles.css", b"body { color: black; }"),
+        ("data.json", b'{"key": "value"}'),
+        ("readme.md", b"# Test Project"),
+        ("src/app.js", b"console.log('Hello');"),
+        ("src/utils.py", b"def hello(): return 'Hello'"),
+        ("docs/guide.md", b"# User Guide"),
+        ("docs/config.json", b'{"debug": true}'),
+        # Files that can be detected by content analysis
+        ("components/Button.js", REACT_CONTENT),
+        ("app.config", CONFIG_CONTENT),
+        ("run.sh", SCRIPT_CONTENT),
+        ("database.txt", SQL_CONTENT),
         # Duplicate files for testing
-        duplicate_content = "This is a duplicate file for testing purposes."
-        open(os.path.join(self.test_dir, "original.txt"), "w").write(duplicate_content)
-        open(os.path.join(self.test_dir, "copy.txt"), "w").write(duplicate_content)
+        ("original.txt", DUPLICATE_CONTENT),
+        ("copy.txt", DUPLICATE_CONTENT),
+    ]
+    
+    # Paths the test files should end up at, as path components relative to the test directory
+    EXPECTED_STANDARD = frozenset([
+        ("Python", "script.py"),
+        ("Python", "utils.py"),
+        ("Web", "HTML", "index.html"),
+        ("Web", "CSS", "styles.css"),
+        ("Web", "JavaScript", "app.js"),
+        ("Data", "JSON", "data.json"),
+        ("Config", "JSON", "config.json"),
+        ("Documentation", "Markdown", "readme.md"),
+        ("Documentation", "Markdown", "guide.md"),
+    ])
+    EXPECTED_SMART = frozenset([
+        ("Web", "React", "Button.js"),
+        ("Config", "General", "app.config"),
+        ("Python", "Scripts", "run.sh"),
+        ("Database", "SQL", "database.txt"),
+    ])
+    EXPECTED_PROJECT = frozenset([
+        ("Python", "script.py"),
+        ("src", "Python", "utils.py"),
+        ("Web", "HTML", "index.html"),
+        ("Web", "CSS", "styles.css"),
+        ("src", "Web", "JavaScript", "app.js"),
+        ("Data", "JSON", "data.json"),
+        ("Config", "JSON", "config.json"),
+        ("Documentation", "Markdown", "readme.md"),
+        ("docs", "Documentation", "Markdown", "guide.md"),
+    ])
+    
+    @classmethod
+    def setUpClass(cls):
+        # Build the test file tree once, each test works on a copy of it
+        cls._template = tempfile.mkdtemp()
+        cls.create_test_files(cls._template)
+    
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls._template)
+    
+    def setUp(self):
+        # Create a temporary directory with a copy of the test files
+        self._td = tempfile.TemporaryDirectory(**TEMPDIR_OPTIONS)
+        self.test_dir = os.path.join(self._td.name, "tree")
+        shutil.copytree(self._template, self.test_dir)
+        
+    def tearDown(self):
+        # Clean up the temporary directory, tolerating files still held open (e.g. by antivirus on Windows)
+        self._td.cleanup()
+        
+    @classmethod
+    def create_test_files(cls, root):
+        """Create test files with different extensions, plus files for smart detection testing"""
+        cls.write_files(root, cls.FILES)
+    
+    @staticmethod
+    def write_files(root, files):
+        """Write (relative path, bytes) pairs under root with unbuffered os-level writes"""
+        made = set()
+        for name, data in files:
+            path = os.path.join(root, name)
+            parent = os.path.dirname(path)
+            if parent not in made:
+                os.makedirs(parent, exist_ok=True)
+                made.add(parent)
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                os.write(fd, data)
+            finally:
+                os.close(fd)
+    
+    def run_organizer(self, *args):
+        """Run the organizer's command line entry point in-process on the test directory"""
+        try:
+            file_organizer.main([self.test_dir, "--no-hash-cache"] + list(args))
+        except SystemExit as e:
+            if e.code:
+                self.fail(f"Organizer exited with status {e.code}")
+    
+    def _collect(self):
+        """Collect the paths of all files in the test directory as relative path components, in one scandir sweep"""
+        found = set()
+        stack = [self.test_dir]
+        while stack:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    else:
+                        found.add(tuple(os.path.relpath(entry.path, self.test_dir).split(os.sep)))
+        return found
     
     def test_organizer_standard_mode(self):
-        """Test the organizer in standard mode"""
-        script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "file_organizer.py")
+        """Test the organizer in standard mode, including smart detection and the report"""
+        report_file = os.path.join(self.test_dir, "report.json")
         
-        # Run the organizer on the test directory
-        subprocess.run([sys.executable, script_path, self.test_dir], check=True)
+        # Run the organizer on the test directory once, with a report
+        self.run_organizer("--report", "--report-file", report_file)
+        found = self._collect()
         
         # Verify the files have been organized correctly
-        self.assertTrue(os.path.exists(os.path.join(self.test_dir, "Python", "script.py")))
-        self.assertTrue(os.path.exists(os.path.join(self.test_dir, "Python", "utils.py")))
-        self.assertTrue(os.path.exists(os.path.join(self.test_dir, "Web", "HTML", "index.html")))
-        self.assertTrue(os.path.exists(os.path.join(self.test_dir, "Web", "CSS", "styles.css")))
-        self.assertTrue(os.path.exists(os.path.join(self.test_dir, "Web", "JavaScript", "app.js")))
-        self.assertTrue(os.path.exists(os.path.join(self.test_dir, "Data", "JSON", "data.json")))
-        self.assertTrue(os.path.exists(os.path.join(self.test_dir, "Data", "JSON", "config.json")))
-        self.assertTrue(os.path.exists(os.path.join(self.test_dir, "Documentation", "Markdown", "readme.md")))
-        self.assertTrue(os.path.exists(os.path.join(self.test_dir, "Documentation", "Markdown", "guide.md")))
+        with self.subTest("extension mapping"):
+            missing = self.EXPECTED_STANDARD - found
+            self.assertFalse(missing, f"missing: {sorted(missing)}")
+        
+        # Check smart detection results
+        with self.subTest("smart detection"):
+            missing = self.EXPECTED_SMART - found
+            self.assertFalse(missing, f"missing: {sorted(missing)}")
+        
+        with self.subTest("report"):
+            # Check if report file was created
+            self.assertIn((os.path.basename(report_file),), found)
+            
+            # Load and verify report contents
+            with open(report_file, 'rb') as f:
+                data = f.read()
+            report = orjson.loads(data) if orjson is not None else json.loads(data)
+            self.assertIn('statistics', report)
+            self.assertIn('version', report)
+                
+            # Test duplicate file detection (should be in the report)
+            self.assertIn('duplicate_files', report['statistics'])
 
     def test_organizer_project_mode(self):
         """Test the organizer in project mode"""
-        # First, restore the original structure
-        self.tearDown()
-        self.setUp()
-        
-        script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "file_organizer.py")
-        
         # Run the organizer on the test directory with project mode
-        subprocess.run([sys.executable, script_path, self.test_dir, "--project-mode"], check=True)
+        self.run_organizer("--project-mode")
         
         # Verify the files have been organized while maintaining project structure
-        self.assertTrue(os.path.exists(os.path.join(self.test_dir, "Python", "script.py")))
-        self.assertTrue(os.path.exists(os.path.join(self.test_dir, "src", "Python", "utils.py")))
-        self.assertTrue(os.path.exists(os.path.join(self.test_dir, "Web", "HTML", "index.html")))
-        self.assertTrue(os.path.exists(os.path.join(self.test_dir, "Web", "CSS", "styles.css")))
-        self.assertTrue(os.path.exists(os.path.join(self.test_dir, "src", "Web", "JavaScript", "app.js")))
-        self.assertTrue(os.path.exists(os.path.join(self.test_dir, "Data", "JSON", "data.json")))
-        self.assertTrue(os.path.exists(os.path.join(self.test_dir, "docs", "Data", "JSON", "config.json")))
-        self.assertTrue(os.path.exists(os.path.join(self.test_dir, "Documentation", "Markdown", "readme.md")))
-        self.assertTrue(os.path.exists(os.path.join(self.test_dir, "docs", "Documentation", "Markdown", "guide.md")))
-    
-    def test_smart_detection(self):
-        """Test the smart detection features"""
-        # First, restore the original structure
-        self.tearDown()
-        self.setUp()
+        found = self._collect()
+        missing = self.EXPECTED_PROJECT - found
+        self.assertFalse(missing, f"missing: {sorted(missing)}")
+
+    def test_interrupted_move_stops_queued_moves(self):
+        """An interrupt while moving files doesn't run the moves still queued"""
+        organizer = file_organizer.FileOrganizer(self.test_dir, hash_cache=None)
+        target_dir = os.path.join(self.test_dir, "moved")
+        os.makedirs(target_dir)
+        sources = [os.path.join(self.test_dir, name) for name, _ in self.FILES if "/" not in name]
+        moves = [(path, os.path.join(target_dir, os.path.basename(path))) for path in sources]
+        file_stats = {path: os.stat(path) for path in sources}
         
-        script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "file_organizer.py")
-        report_file = os.path.join(self.test_dir, "report.json")
+        moved = []
+        release = threading.Event()
+        real_move_file = organizer._move_file
         
-        # Run the organizer with a report
-        subprocess.run([
-            sys.executable, 
-            script_path, 
-            self.test_dir, 
-            "--report", 
-            "--report-file", 
-            report_file
-        ], check=True)
+        def move_file(file_path, target_path, source_dev):
+            # Hold the second move until the interrupt has been handled
+            if moved:
+                release.wait(5)
+            moved.append(file_path)
+            real_move_file(file_path, target_path, source_dev)
         
-        # Check smart detection results
-        self.assertTrue(os.path.exists(os.path.join(self.test_dir, "Web", "React", "Button.js")))
-        self.assertTrue(os.path.exists(os.path.join(self.test_dir, "Config", "General", "app.config")))
-        self.assertTrue(os.path.exists(os.path.join(self.test_dir, "Python", "Scripts", "run.sh")))
-        self.assertTrue(os.path.exists(os.path.join(self.test_dir, "Database", "SQL", "database.txt")))
+        def interrupt(*args, **kwargs):
+            threading.Timer(0.2, release.set).start()
+            raise KeyboardInterrupt
         
-        # Check if report file was created
-        self.assertTrue(os.path.exists(report_file))
+        with mock.patch.object(file_organizer, "MOVE_WORKERS", 1), \
+                mock.patch.object(organizer, "_move_file", side_effect=move_file), \
+                mock.patch.object(file_organizer.logger, "info", side_effect=interrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                organizer._move_files(moves, file_stats)
         
-        # Load and verify report contents
-        with open(report_file, 'r') as f:
-            report = json.load(f)
-            self.assertIn('statistics', report)
-            self.assertIn('version', report)
-            
-        # Test duplicate file detection (should be in the report)
-        self.assertIn('duplicate_files', report['statistics'])
+        self.assertEqual(moved, sources[:2])
+        self.assertEqual(set(os.listdir(target_dir)), {os.path.basename(path) for path in sources[:2]})
+
+class TestDuplicateDetection(unittest.TestCase):
+    FILES = [
+        # Same size, only differ after the first 4KB
+        ("head_a.bin", b"a" * 4096 + b"x" * 100),
+        ("head_b.bin", b"a" * 4096 + b"y" * 100),
+        # Identical files larger than 4KB
+        ("large_a.bin", b"b" * 5000),
+        ("large_b.bin", b"b" * 5000),
+        # Identical small files, and a different one of the same size
+        ("small_a.txt", b"small"),
+        ("small_b.txt", b"small"),
+        ("small_c.txt", b"other"),
+        # Empty files
+        ("empty_a.txt", b""),
+        ("empty_b.txt", b""),
+        ("unique.txt", b"unique size"),
+    ]
+    EXPECTED_DUPLICATES = {
+        frozenset(["large_a.bin", "large_b.bin"]),
+        frozenset(["small_a.txt", "small_b.txt"]),
+        frozenset(["empty_a.txt", "empty_b.txt"]),
+    }
+    
+    def setUp(self):
+        self._td = tempfile.TemporaryDirectory(**TEMPDIR_OPTIONS)
+        self.addCleanup(self._td.cleanup)
+        TestFileOrganizer.write_files(self._td.name, self.FILES)
+    
+    def test_find_duplicate_files(self):
+        """Only files with identical content are reported, including ones that differ past the hashed head"""
+        organizer = file_organizer.FileOrganizer(self._td.name, hash_cache=None)
+        duplicates = organizer.find_duplicate_files()
+        found = {frozenset(os.path.basename(path) for path in paths) for paths in duplicates.values()}
+        self.assertEqual(found, self.EXPECTED_DUPLICATES)
+
+class TestHashCache(unittest.TestCase):
+    def setUp(self):
+        self._td = tempfile.TemporaryDirectory(**TEMPDIR_OPTIONS)
+        self.addCleanup(self._td.cleanup)
+        self.root = self._td.name
+        self.db_path = os.path.join(self.root, "cache", "hashes.db")
+        TestFileOrganizer.write_files(self.root, [("a.txt", b"first"), ("b.txt", b"second")])
+        self.file_path = os.path.join(self.root, "a.txt")
+        self.cache = self.open_cache()
+    
+    def open_cache(self):
+        cache = file_organizer.HashCache(self.db_path)
+        self.addCleanup(cache._conn.close)
+        return cache
+    
+    def test_hit_when_size_and_mtime_match(self):
+        """A stored hash is returned for an unchanged file, also from a reopened cache"""
+        st = os.stat(self.file_path)
+        self.cache.put(self.file_path, st, "abc")
+        self.assertEqual(self.cache.get(self.file_path, st), "abc")
+        
+        self.cache.close()
+        self.assertEqual(self.open_cache().get(self.file_path, st), "abc")
+    
+    def test_miss_after_mtime_change(self):
+        """A stored hash is stale once the file's mtime changes"""
+        st = os.stat(self.file_path)
+        self.cache.put(self.file_path, st, "abc")
+        os.utime(self.file_path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        self.assertIsNone(self.cache.get(self.file_path, os.stat(self.file_path)))
+    
+    def test_miss_after_algorithm_change(self):
+        """A hash stored with another algorithm is not returned"""
+        st = os.stat(self.file_path)
+        self.cache.put(self.file_path, st, "abc")
+        with mock.patch.object(file_organizer, "HASH_ALGORITHM", "other"):
+            self.assertIsNone(self.cache.get(self.file_path, st))
+    
+    def test_rename_carries_hash(self):
+        """A hash follows its file to the new path"""
+        st = os.stat(self.file_path)
+        new_path = os.path.join(self.root, "moved.txt")
+        self.cache.put(self.file_path, st, "abc")
+        self.cache.rename(self.file_path, new_path)
+        self.assertEqual(self.cache.get(new_path, st), "abc")
+        self.assertIsNone(self.cache.get(self.file_path, st))
+    
+    def test_prune_drops_deleted_files(self):
+        """Pruning removes entries for deleted files and keeps the others"""
+        other_path = os.path.join(self.root, "b.txt")
+        st = os.stat(self.file_path)
+        other_st = os.stat(other_path)
+        self.cache.put(self.file_path, st, "abc")
+        self.cache.put(other_path, other_st, "def")
+        os.remove(self.file_path)
+        self.cache.prune(self.root)
+        self.assertIsNone(self.cache.get(self.file_path, st))
+        self.assertEqual(self.cache.get(other_path, other_st), "def")
+    
+    def test_database_error_falls_back_to_hashing(self):
+        """The organizer stops using a failing cache and hashes files directly"""
+        organizer = file_organizer.FileOrganizer(self.root, hash_cache=self.db_path)
+        cache = organizer.get_hash_cache()
+        self.addCleanup(cache._conn.close)
+        cache._conn.close()
+        
+        with self.assertLogs(file_organizer.logger, "WARNING"):
+            file_hash = organizer.get_cached_file_hash(self.file_path)
+        self.assertEqual(file_hash, organizer.get_file_hash(self.file_path))
+        self.assertIsNone(organizer.get_hash_cache())
 
 if __name__ == "__main__":
     unittest.main() 
\ No newline at end of file